@@ -1,34 +1,138 @@
 import ast
 import asyncio
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 
 import cv2
 import numpy as np
 import onnxruntime as ort
+import orjson
+import simplejpeg
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 
+try:
+    from numba import njit, prange
+except ImportError:  # numba 미설치 시 cv2 + numpy 경로 사용
+    njit = None
+
 MODEL_PATH = "model/yolo26n.onnx"
+# utils/get_model.py가 생성하는 uint8 NHWC 입력 모델 (정규화가 그래프 안에 포함됨)
+FUSED_MODEL_PATH = "model/yolo26n_u8.onnx"
+# utils/quantize_model.py가 생성하는 INT8(QDQ) 모델 — 재현율이 떨어지므로
+# YOLO_USE_INT8=1일 때만 사용 (model/README.md 참고)
+INT8_MODEL_PATH = "model/yolo26n_int8.onnx"
+USE_INT8 = os.environ.get("YOLO_USE_INT8") == "1"
 INPUT_SIZE = 640
 CONF_THRESHOLD = 0.4
+# 비압축 프레임 헤더: magic(4B) + height, width, channels (uint32 LE)
+RAW_MAGIC = b"RAW\x00"
+RAW_HEADER = struct.Struct("<4sIII")
+# 배치 메시지: magic(4B) + 프레임 수(uint32), 이후 프레임마다 길이(uint32) + 페이로드
+BATCH_MAGIC = b"BAT\x00"
+BATCH_HEADER = struct.Struct("<4sI")
+FRAME_LEN = struct.Struct("<I")
+# 동적 배치: 최대 MAX_BATCH 프레임을 MAX_WAIT_MS 동안 모아 한 번에 추론
+MAX_BATCH = 8
+MAX_WAIT_MS = 5
+# 코어 배분: 디코딩 스레드 풀과 ORT 내부 스레드 풀이 서로 겹치지 않도록 나눈다
+# (추론 호출 자체는 전용 스레드 1개에서 직렬로 실행)
+DECODE_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+ORT_INTRA_OP_THREADS = max(1, (os.cpu_count() or 1) - DECODE_WORKERS)
 
 session: ort.InferenceSession | None = None
 CLASS_NAMES: dict[int, str] = {}
+CLASS_NAME_TABLE: tuple[str, ...] = ()  # label → 이름 (해시 없이 인덱스로 조회)
+INPUT_UINT8 = False
+infer_queue: asyncio.Queue | None = None
+infer_executor: ThreadPoolExecutor | None = None
+decode_executor: ThreadPoolExecutor | None = None
+
+# IOBinding: 입력 버퍼를 한 번만 할당하고 매 프레임 덮어쓴다
+io_binding: ort.IOBinding | None = None
+input_buf: np.ndarray | None = None
+_input_values: dict[int, ort.OrtValue] = {}  # 배치 크기 → input_buf[:n] OrtValue
+output_name = "output0"
+
+
+def model_candidates() -> list[str]:
+    """(INT8 →) 전처리 융합 → 원본 순으로 존재하는 모델 경로"""
+    paths = [INT8_MODEL_PATH] if USE_INT8 else []
+    paths += [FUSED_MODEL_PATH, MODEL_PATH]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def select_providers() -> list[str]:
+    """CUDA EP가 있으면 GPU 우선, 없으면 CPU로 폴백"""
+    if "CUDAExecutionProvider" in ort.get_available_providers():
+        return ["CUDAExecutionProvider", "CPUExecutionProvider"]
+    return ["CPUExecutionProvider"]
+
+
+def create_session() -> tuple[ort.InferenceSession, str]:
+    """후보 모델을 순서대로 로드하고, 실패하면 다음 모델로 폴백"""
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.enable_cpu_mem_arena = True
+    sess_options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    sess_options.inter_op_num_threads = 1
+    sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+
+    candidates = model_candidates() or [MODEL_PATH]
+    for i, path in enumerate(candidates):
+        try:
+            loaded = ort.InferenceSession(
+                path, sess_options=sess_options, providers=select_providers()
+            )
+            return loaded, path
+        except Exception as e:
+            if i == len(candidates) - 1:
+                raise
+            print(f"[YOLO] 모델 로드 실패, 다음 모델로 폴백: {path} ({e})")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global session, CLASS_NAMES
-    session = ort.InferenceSession(MODEL_PATH, providers=["CPUExecutionProvider"])
+    global session, CLASS_NAMES, CLASS_NAME_TABLE, INPUT_UINT8
+    global infer_queue, infer_executor, decode_executor
+    global io_binding, input_buf, output_name
+    session, model_path = create_session()
+    INPUT_UINT8 = session.get_inputs()[0].type == "tensor(uint8)"
+
+    if INPUT_UINT8:
+        input_buf = np.empty((MAX_BATCH, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8)
+    else:
+        input_buf = np.empty((MAX_BATCH, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+    _input_values.clear()
+    io_binding = session.io_binding()
+    output_name = session.get_outputs()[0].name
 
     # ultralytics ONNX 메타데이터에서 클래스 이름 추출
     # custom_metadata_map["names"] 예시: "{0: 'person', 1: 'bicycle', ...}"
     meta = session.get_modelmeta().custom_metadata_map
     if "names" in meta:
         CLASS_NAMES = ast.literal_eval(meta["names"])
+    CLASS_NAME_TABLE = tuple(
+        CLASS_NAMES.get(i, f"cls{i}") for i in range(max(CLASS_NAMES, default=-1) + 1)
+    )
+
+    print(
+        f"[YOLO] 모델 로드 완료: {model_path} ({len(CLASS_NAMES)}개 클래스, "
+        f"{session.get_providers()[0]})"
+    )
 
-    print(f"[YOLO] 모델 로드 완료: {MODEL_PATH} ({len(CLASS_NAMES)}개 클래스)")
+    infer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infer")
+    decode_executor = ThreadPoolExecutor(
+        max_workers=DECODE_WORKERS, thread_name_prefix="decode"
+    )
+    infer_queue = asyncio.Queue()
+    worker = asyncio.create_task(batch_worker())
     yield
+    worker.cancel()
+    infer_executor.shutdown()
+    decode_executor.shutdown()
     session = None
 
 
@@ -43,57 +147,214 @@ app.add_middleware(
 
 
 # ── 전처리 ──────────────────────────────────────────────────────────────────
-def preprocess(frame: np.ndarray) -> tuple[np.ndarray, float, float]:
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _resize_normalize_chw(src: np.ndarray, dst: np.ndarray) -> None:
+        """
+        bilinear 리사이즈(cv2.INTER_LINEAR와 같은 픽셀 중심 정렬) + HWC→CHW + /255를
+        한 번의 패스로 수행해 float32 입력 버퍼(dst: (3, H, W))에 바로 기록한다.
+        """
+        src_h, src_w = src.shape[0], src.shape[1]
+        dst_h, dst_w = dst.shape[1], dst.shape[2]
+        scale_y = src_h / dst_h
+        scale_x = src_w / dst_w
+        for y in prange(dst_h):
+            sy = max((y + 0.5) * scale_y - 0.5, 0.0)
+            y0 = min(int(sy), src_h - 1)
+            y1 = min(y0 + 1, src_h - 1)
+            wy = sy - y0
+            for x in range(dst_w):
+                sx = max((x + 0.5) * scale_x - 0.5, 0.0)
+                x0 = min(int(sx), src_w - 1)
+                x1 = min(x0 + 1, src_w - 1)
+                wx = sx - x0
+                for c in range(3):
+                    top = src[y0, x0, c] * (1.0 - wx) + src[y0, x1, c] * wx
+                    bottom = src[y1, x0, c] * (1.0 - wx) + src[y1, x1, c] * wx
+                    dst[c, y, x] = (top * (1.0 - wy) + bottom * wy) / 255.0
+
+else:
+    _resize_normalize_chw = None
+
+
+def preprocess(frame: np.ndarray, out: np.ndarray) -> tuple[float, float]:
+    """
+    리사이즈 결과를 입력 버퍼의 한 칸(out)에 바로 기록한다.
+    융합 모델: (H, W, 3) uint8 그대로 (전치·정규화는 그래프에서 수행)
+    기본 모델: (3, H, W) float32 / 255 (numba가 있으면 단일 패스 커널 사용)
+    """
+    # numba 커널은 범위 검사가 없으므로 cv2 경로와 똑같이 여기서 거른다
+    if frame.ndim != 3 or frame.shape[2] != 3 or frame.size == 0:
+        raise ValueError(f"invalid frame shape: {frame.shape}")
     orig_h, orig_w = frame.shape[:2]
-    resized = cv2.resize(frame, (INPUT_SIZE, INPUT_SIZE))
-    inp = resized.transpose(2, 0, 1)[np.newaxis].astype(np.float32) / 255.0
+    if INPUT_UINT8:
+        cv2.resize(frame, (INPUT_SIZE, INPUT_SIZE), dst=out)
+    elif _resize_normalize_chw is not None:
+        _resize_normalize_chw(frame, out)
+    else:
+        resized = cv2.resize(frame, (INPUT_SIZE, INPUT_SIZE))
+        np.divide(resized.transpose(2, 0, 1), np.float32(255.0), out=out)
     scale_x = orig_w / INPUT_SIZE
     scale_y = orig_h / INPUT_SIZE
-    return inp, scale_x, scale_y
+    return scale_x, scale_y
+
+
+# ── 디코딩 ──────────────────────────────────────────────────────────────────
+def decode_frame(data: bytes | memoryview) -> np.ndarray | None:
+    """
+    RAW 헤더가 붙은 비압축 프레임은 복사 없이 ndarray로 해석하고,
+    JPEG은 libjpeg-turbo(SIMD) 기반 simplejpeg로 디코딩하며,
+    그 외 포맷(PNG 등)은 cv2.imdecode로 처리한다.
+    """
+    if data[:4] == RAW_MAGIC:
+        if len(data) < RAW_HEADER.size:
+            return None
+        _, h, w, c = RAW_HEADER.unpack_from(data)
+        # BGR 3채널만 허용: 전처리(cv2.resize dst=, numba 커널)가 (H, W, 3)을 가정한다
+        if c != 3 or h == 0 or w == 0:
+            return None
+        if len(data) - RAW_HEADER.size != h * w * c:
+            return None
+        return np.frombuffer(data, np.uint8, offset=RAW_HEADER.size).reshape(h, w, c)
+    if data[:2] == b"\xff\xd8":
+        try:
+            return simplejpeg.decode_jpeg(data, colorspace="BGR")
+        except ValueError:
+            return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def decode_batch(data: bytes) -> list[np.ndarray] | None:
+    """배치 메시지 → 프레임 리스트 (하나라도 잘못되면 None)"""
+    try:
+        frames = [decode_frame(p) for p in split_batch(data)]
+    except (ValueError, struct.error):
+        return None
+    if any(frame is None for frame in frames):
+        return None
+    return frames
+
+
+def split_batch(data: bytes) -> list[memoryview]:
+    """배치 메시지를 프레임별 페이로드로 분리 (memoryview라 복사 없음)"""
+    _, count = BATCH_HEADER.unpack_from(data)
+    view = memoryview(data)
+    pos = BATCH_HEADER.size
+    payloads = []
+    for _ in range(count):
+        (size,) = FRAME_LEN.unpack_from(data, pos)
+        pos += FRAME_LEN.size
+        if pos + size > len(data):
+            raise ValueError("truncated batch")
+        payloads.append(view[pos : pos + size])
+        pos += size
+    return payloads
 
 
 # ── 후처리 ──────────────────────────────────────────────────────────────────
-def postprocess(raw: np.ndarray, scale_x: float, scale_y: float) -> list[dict]:
+def postprocess(dets: np.ndarray, scale_x: float, scale_y: float) -> list[dict]:
     """
     YOLO26 출력 형태: (N, 6) — [x1, y1, x2, y2, score, label]
-    배치 차원이 있으면 (1, N, 6)이므로 squeeze 처리.
+    열 단위(SoA)로 벡터 연산하며, 검출이 없으면 빈 배열이 그대로 흘러 []가 된다.
     """
-    if raw is None or raw.size == 0:
-        return []
-
-    dets = raw.squeeze()  # (1,N,6) → (N,6) or (N,6) 그대로
-    if dets.ndim == 1:
-        dets = dets[np.newaxis]  # 단일 검출 → (1,6)
-
-    results: list[dict] = []
-    for row in dets:
-        if len(row) < 6:
-            continue
-        x1, y1, x2, y2, score, label = row[:6]
-        if score < CONF_THRESHOLD:
-            continue
-        results.append(
-            {
-                "box": [
-                    int(x1 * scale_x),
-                    int(y1 * scale_y),
-                    int(x2 * scale_x),
-                    int(y2 * scale_y),
-                ],
-                "score": round(float(score), 4),
-                "label": int(label),
-                "name": CLASS_NAMES.get(int(label), f"cls{int(label)}"),
-            }
-        )
-    return results
+    dets = dets[dets[:, 4] >= CONF_THRESHOLD]
+    scale = np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+    boxes = (dets[:, :4] * scale).astype(np.int32).tolist()
+    scores = np.round(dets[:, 4].astype(np.float64), 4).tolist()
+    labels = dets[:, 5].astype(np.int32).tolist()
+
+    return [
+        {
+            "box": box,
+            "score": score,
+            "label": label,
+            "name": (
+                CLASS_NAME_TABLE[label]
+                if 0 <= label < len(CLASS_NAME_TABLE)
+                else f"cls{label}"
+            ),
+        }
+        for box, score, label in zip(boxes, scores, labels)
+    ]
 
 
 # ── 공통 추론 로직 ────────────────────────────────────────────────────────────
-def infer(frame: np.ndarray) -> list[dict]:
-    """프레임 → detections (바운딩 박스 그리기는 클라이언트 담당)"""
-    inp, scale_x, scale_y = preprocess(frame)
-    outputs = session.run(None, {"images": inp})
-    return postprocess(np.asarray(outputs[0]), scale_x, scale_y)
+def infer_batch(frames: list[np.ndarray]) -> list[list[dict]]:
+    """프레임 B개 → 입력 버퍼 [:B]에 전처리 → IOBinding 추론 한 번 → 프레임별 detections"""
+    n = len(frames)
+    scales = [preprocess(frame, input_buf[i]) for i, frame in enumerate(frames)]
+
+    ort_input = _input_values.get(n)
+    if ort_input is None:
+        ort_input = ort.OrtValue.ortvalue_from_numpy(input_buf[:n])
+        _input_values[n] = ort_input
+    io_binding.bind_ortvalue_input("images", ort_input)
+    # 출력은 매번 다시 바인딩: 한 번 할당된 출력 OrtValue는 shape이 고정되어
+    # 배치 크기가 바뀌면 run_with_iobinding이 INVALID_ARGUMENT로 실패한다.
+    io_binding.bind_output(output_name, "cpu")
+    session.run_with_iobinding(io_binding)
+
+    # (B, N, 6) view — squeeze/ndim 분기 없이 프레임별 (N, 6)로 바로 인덱싱
+    raw = io_binding.get_outputs()[0].numpy().reshape(n, -1, 6)
+    return [
+        postprocess(raw[i], scale_x, scale_y)
+        for i, (scale_x, scale_y) in enumerate(scales)
+    ]
+
+
+def infer_each(frames: list[np.ndarray]) -> list[list[dict] | Exception]:
+    """배치 추론 실패 시 프레임별로 다시 추론해 실패한 프레임만 예외로 남긴다"""
+    results: list[list[dict] | Exception] = []
+    for frame in frames:
+        try:
+            results.append(infer_batch([frame])[0])
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def submit(frame: np.ndarray) -> asyncio.Future:
+    """추론 큐에 프레임을 넣고 detections를 받을 Future를 반환"""
+    fut = asyncio.get_running_loop().create_future()
+    infer_queue.put_nowait((frame, fut))
+    return fut
+
+
+async def batch_worker() -> None:
+    """큐에서 최대 MAX_BATCH개를 MAX_WAIT_MS 동안 모아 배치 추론 후 결과를 분배"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await infer_queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(infer_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        frames = [frame for frame, _ in batch]
+        try:
+            results = await loop.run_in_executor(infer_executor, infer_batch, frames)
+        except Exception:
+            # 배치에는 다른 연결의 프레임도 섞여 있으므로, 잘못된 프레임의 연결만 실패시킨다
+            results = await loop.run_in_executor(infer_executor, infer_each, frames)
+
+        for (_, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+
+async def send_json(websocket: WebSocket, payload: dict) -> None:
+    """orjson으로 직렬화해 텍스트 프레임으로 전송 (Go 서버·Flutter 클라이언트와 동일)"""
+    await websocket.send_text(orjson.dumps(payload).decode())
 
 
 # ── 헬스 체크 ────────────────────────────────────────────────────────────────
@@ -106,25 +367,34 @@ async def root():
 @app.websocket("/ws/stream")
 async def ws_stream(websocket: WebSocket):
     """
-    클라이언트 → 서버: JPEG/PNG 바이너리 프레임
+    클라이언트 → 서버: JPEG/PNG 바이너리 프레임 또는 RAW 헤더 + BGR uint8 프레임
     서버 → 클라이언트: JSON — {"detections": [{box, score, label, name}, ...]}
+    배치 메시지(BAT 헤더)는 {"batched": [detections_0, detections_1, ...]}로 응답한다.
     바운딩 박스 그리기는 클라이언트가 담당한다.
     """
     await websocket.accept()
+    loop = asyncio.get_running_loop()
     try:
         while True:
             data = await websocket.receive_bytes()
 
-            nparr = np.frombuffer(data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if data[:4] == BATCH_MAGIC:
+                frames = await loop.run_in_executor(decode_executor, decode_batch, data)
+                if frames is None:
+                    await send_json(websocket, {"error": "invalid batch"})
+                    continue
+
+                batched = await asyncio.gather(*(submit(f) for f in frames))
+                await send_json(websocket, {"batched": batched})
+                continue
+
+            frame = await loop.run_in_executor(decode_executor, decode_frame, data)
             if frame is None:
-                await websocket.send_json({"error": "invalid image"})
+                await send_json(websocket, {"error": "invalid image"})
                 continue
 
-            detections = await asyncio.get_event_loop().run_in_executor(
-                None, infer, frame
-            )
-            await websocket.send_json({"detections": detections})
+            detections = await submit(frame)
+            await send_json(websocket, {"detections": detections})
 
     except WebSocketDisconnect:
         pass
@@ -135,4 +405,12 @@ async def ws_stream(websocket: WebSocket):
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=False)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        reload=False,
+        loop="uvloop",
+        ws="websockets",
+        ws_per_message_deflate=False,
+    )
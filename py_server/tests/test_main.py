@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+_ROOT = Path(__file__).parent.parent.parent
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # main.py의 모델 경로("model/...")는 저장소 루트 기준
+    monkeypatch.chdir(_ROOT)
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def frame():
+    return cv2.imread(str(_ROOT / "assets/test.jpg"))
+
+
+def test_infer_batch_with_changing_batch_size(server, frame):
+    single = main.infer_batch([frame])
+    pair = main.infer_batch([frame, frame])
+    again = main.infer_batch([frame])
+
+    # 배치 크기에 따라 커널이 달라 점수가 미세하게 다를 수 있으므로 라벨만 비교
+    labels = [d["label"] for d in single[0]]
+    assert len(pair) == 2
+    assert [d["label"] for d in pair[0]] == labels
+    assert [d["label"] for d in pair[1]] == labels
+    assert [d["label"] for d in again[0]] == labels
+
+
+def test_infer_each_isolates_bad_frame(server, frame):
+    bad = np.zeros((0, 0, 3), dtype=np.uint8)
+
+    results = main.infer_each([frame, bad])
+
+    assert [d["label"] for d in results[0]] == [
+        d["label"] for d in main.infer_batch([frame])[0]
+    ]
+    assert isinstance(results[1], Exception)
+
+
+def test_decode_frame_rejects_truncated_raw_header():
+    assert main.decode_frame(main.RAW_MAGIC + b"\x01\x00") is None
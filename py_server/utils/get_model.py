@@ -1,7 +1,53 @@
 import os
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
 from ultralytics import YOLO
 
 os.makedirs("../model", exist_ok=True)
 
 model = YOLO("../model/yolo26n.pt")
-model.export(format="onnx", dynamic=True)
+onnx_path = model.export(format="onnx", dynamic=True)
+
+# ── 전처리 융합 모델 생성 ────────────────────────────────────────────────────
+# uint8 NHWC 입력 → Transpose(0,3,1,2) → Cast(float32) → Mul(1/255) → 원본 그래프
+# 서버는 리사이즈한 BGR 프레임을 그대로 넘기면 된다.
+FUSED_PATH = "../model/yolo26n_u8.onnx"
+
+fused = onnx.load(onnx_path)
+graph = fused.graph
+orig_input = graph.input[0]
+input_name = orig_input.name
+float_name = f"{input_name}_f32"
+
+for node in graph.node:
+    for i, name in enumerate(node.input):
+        if name == input_name:
+            node.input[i] = float_name
+
+batch, _, height, width = orig_input.type.tensor_type.shape.dim
+new_input = helper.make_tensor_value_info(input_name, TensorProto.UINT8, None)
+new_input.type.tensor_type.shape.dim.extend([batch, height, width])
+new_input.type.tensor_type.shape.dim.add().dim_value = 3
+graph.input.remove(orig_input)
+graph.input.insert(0, new_input)
+
+graph.initializer.append(
+    numpy_helper.from_array(np.array(1.0 / 255.0, dtype=np.float32), "inv_255")
+)
+pre_nodes = [
+    helper.make_node(
+        "Transpose", [input_name], ["pre_nchw"], perm=[0, 3, 1, 2], name="pre_transpose"
+    ),
+    helper.make_node(
+        "Cast", ["pre_nchw"], ["pre_float"], to=TensorProto.FLOAT, name="pre_cast"
+    ),
+    helper.make_node("Mul", ["pre_float", "inv_255"], [float_name], name="pre_scale"),
+]
+for node in reversed(pre_nodes):
+    graph.node.insert(0, node)
+
+onnx.checker.check_model(fused)
+onnx.save(fused, FUSED_PATH)
+print(f"전처리 융합 모델 저장: {FUSED_PATH}")
@@ -0,0 +1,81 @@
+import argparse
+import os
+import tempfile
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+parser = argparse.ArgumentParser(description="YOLO ONNX 모델 INT8 정적 양자화 (QDQ)")
+parser.add_argument("--video", type=str, default="../assets/test.mp4")
+parser.add_argument("--frames", type=int, default=100, help="캘리브레이션 프레임 수")
+
+args = parser.parse_args()
+
+# 전처리 융합 모델이 있으면 그것을 양자화 (서버와 같은 입력 형식 유지)
+FUSED_PATH = "../model/yolo26n_u8.onnx"
+SRC_PATH = FUSED_PATH if os.path.exists(FUSED_PATH) else "../model/yolo26n.onnx"
+OUT_PATH = "../model/yolo26n_int8.onnx"
+INPUT_SIZE = 640
+
+
+class VideoCalibrationReader(CalibrationDataReader):
+    """영상 전체에서 고르게 뽑은 프레임을 모델 입력 형식으로 제공"""
+
+    def __init__(self, video_path: str, model_path: str, num_frames: int):
+        session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        input_uint8 = model_input.type == "tensor(uint8)"
+
+        cap = cv2.VideoCapture(video_path)
+        step = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) // num_frames, 1)
+        samples = []
+        idx = 0
+        while len(samples) < num_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if idx % step == 0:
+                resized = cv2.resize(frame, (INPUT_SIZE, INPUT_SIZE))
+                if input_uint8:
+                    samples.append(resized[np.newaxis])
+                else:
+                    chw = resized.transpose(2, 0, 1)[np.newaxis]
+                    samples.append(chw.astype(np.float32) / 255.0)
+            idx += 1
+        cap.release()
+
+        print(f"캘리브레이션 프레임: {len(samples)}개 ({video_path})")
+        self._samples = iter(samples)
+
+    def get_next(self) -> dict | None:
+        sample = next(self._samples, None)
+        return None if sample is None else {self.input_name: sample}
+
+
+# Conv만 양자화: 백본 연산량 대부분을 INT8(VNNI/dot-product) 커널로 돌리고
+# 검출 헤드의 정렬·선택 연산은 float으로 남겨 정확도를 유지한다.
+# 활성값 uint8 + 가중치 int8(U8S8): x86 CPU EP의 VNNI 경로가 쓰는 조합.
+with tempfile.TemporaryDirectory() as tmp_dir:
+    prep_path = os.path.join(tmp_dir, "prep.onnx")
+    # 이 모델은 심볼릭 shape 추론이 끝나지 않으므로 ONNX shape 추론만 사용
+    quant_pre_process(SRC_PATH, prep_path, skip_symbolic_shape=True)
+    quantize_static(
+        prep_path,
+        OUT_PATH,
+        VideoCalibrationReader(args.video, SRC_PATH, args.frames),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["Conv"],
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+print(f"INT8 모델 저장: {SRC_PATH} → {OUT_PATH}")
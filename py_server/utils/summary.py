@@ -0,0 +1,40 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+parser = argparse.ArgumentParser(description="벤치마크 CSV 지표 요약")
+parser.add_argument(
+    "bench",
+    type=str,
+    nargs="+",
+    help="test.py가 저장한 CSV (예: results/go_result.csv)",
+)
+
+args = parser.parse_args()
+
+_ROOT = Path(__file__).parent.parent.parent
+
+
+def analyze_and_print_metrics(file_path: str) -> None:
+    # 컬럼: client_id, frame, delay_ms, fps, skipped
+    data = np.loadtxt(
+        file_path, delimiter=",", skiprows=1, usecols=(2, 3), dtype=np.float32, ndmin=2
+    )
+    if len(data) == 0:
+        print(f"[{file_path}] 데이터 없음")
+        return
+
+    delays, fps = data[:, 0], data[:, 1]
+    p95, p99 = np.percentile(delays, [95, 99])
+
+    print(f"── {file_path} ({len(delays)} frames) ────────────────")
+    print(f"  Average Latency : {delays.mean():.2f} ms")
+    print(f"  Average FPS     : {fps.mean():.2f}")
+    print(f"  P95 Latency     : {p95:.2f} ms")
+    print(f"  P99 Latency     : {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    for bench in args.bench:
+        analyze_and_print_metrics(str(_ROOT / bench))
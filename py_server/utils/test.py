@@ -1,16 +1,26 @@
 import argparse
 import asyncio
-import csv
-import json
+import struct
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from functools import cache
 from pathlib import Path
 
+import av
 import cv2
 import numpy as np
+import orjson
+import simplejpeg
 import websockets
 from tqdm import tqdm
 
+try:
+    import uvloop
+except ImportError:  # Windows 등 uvloop 미지원 환경은 기본 이벤트 루프 사용
+    uvloop = None
+
 parser = argparse.ArgumentParser(description="비디오 처리 및 부하 테스트 클라이언트")
 parser.add_argument("--video-in", type=str, default="assets/test_30.mp4")
 parser.add_argument(
@@ -19,6 +29,22 @@ parser.add_argument(
 parser.add_argument("--bench-out", type=str, default="results/benchmark.csv")
 parser.add_argument("--server-type", type=str, default="go", choices=["go", "py"])
 parser.add_argument("--clients", type=int, default=1, help="동시 접속 클라이언트 수")
+parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=1,
+    help="메시지 하나에 묶어 보낼 프레임 수 (py 전용)",
+)
+parser.add_argument(
+    "--raw-frames",
+    action="store_true",
+    help="JPEG 대신 비압축 프레임 전송 (py 전용)",
+)
+parser.add_argument(
+    "--adaptive-skip",
+    action="store_true",
+    help="응답 지연이 프레임 간격보다 길면 다음 프레임들을 건너뜀",
+)
 
 args = parser.parse_args()
 
@@ -33,61 +59,284 @@ elif args.server_type.lower() == "py":
 else:
     sys.exit(f"[오류] 지원하지 않는 서버 타입: {args.server_type}")
 
+if args.batch_size < 1:
+    sys.exit("[오류] --batch-size는 1 이상이어야 합니다")
+if args.batch_size > 1 and args.server_type.lower() != "py":
+    sys.exit("[오류] --batch-size > 1은 py 서버에서만 지원합니다")
+if args.raw_frames and args.server_type.lower() != "py":
+    sys.exit("[오류] --raw-frames는 py 서버에서만 지원합니다")
+
 WS_URL = f"ws://localhost:{PORT}/ws/stream"
 YOLO_INPUT_SIZE = 640
 JPEG_ENCODE_QUALITY = 90
 MAX_WS_MSG_BYTES = 16 * 1024 * 1024
 MAX_WS_TIMEOUT = 60
+MAX_WS_WRITE_BUFFER = 1 << 20
+# 단계 간 큐 크기: 전송 중인 프레임 뒤에 미리 준비해 둘 프레임 수
+PIPELINE_DEPTH = 4
+
+# --raw-frames: JPEG 인코딩/디코딩 없이 비압축 프레임 전송 (Go 서버는 JPEG만 지원)
+USE_RAW_FRAMES = args.raw_frames
+RAW_MAGIC = b"RAW\x00"
+RAW_HEADER = struct.Struct("<4sIII")
+# 배치 메시지: magic(4B) + 프레임 수(uint32), 이후 프레임마다 길이(uint32) + 페이로드
+BATCH_MAGIC = b"BAT\x00"
+BATCH_HEADER = struct.Struct("<4sI")
+FRAME_LEN = struct.Struct("<I")
+# 적응형 프레임 스킵: 지연 EWMA 가중치
+SKIP_EWMA_ALPHA = 0.2
+# 결과 영상 인코더 우선순위: NVENC → x264 → FFmpeg 내장 MPEG-4
+VIDEO_ENCODERS = ("h264_nvenc", "libx264", "mpeg4")
+
+# 배치 메시지가 WebSocket 최대 크기(서버 기본값도 16 MiB)를 넘지 않도록 제한.
+# JPEG 크기는 가변이므로 비압축 프레임 크기를 상한으로 삼는다.
+FRAME_MAX_BYTES = RAW_HEADER.size + YOLO_INPUT_SIZE * YOLO_INPUT_SIZE * 3
+MAX_BATCH_SIZE = (MAX_WS_MSG_BYTES - BATCH_HEADER.size) // (
+    FRAME_LEN.size + FRAME_MAX_BYTES
+)
+if args.batch_size > MAX_BATCH_SIZE:
+    sys.exit(
+        f"[오류] --batch-size는 {MAX_BATCH_SIZE} 이하여야 합니다 "
+        f"(메시지 최대 {MAX_WS_MSG_BYTES >> 20} MiB)"
+    )
 
 
-def save_benchmark(records: list[dict], path: str) -> None:
+def save_benchmark(
+    results: list[tuple[np.ndarray, np.ndarray, np.ndarray]], path: str
+) -> None:
     Path(path).parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["client_id", "frame", "delay_ms", "fps"])
-        writer.writeheader()
-        writer.writerows(records)
+    rows = []
+    for client_id, (delays, fps, skipped) in enumerate(results):
+        n = len(delays)
+        rows.append(
+            np.column_stack(
+                [np.full(n, client_id), np.arange(1, n + 1), delays, fps, skipped]
+            )
+        )
+    table = np.concatenate(rows)
+    np.savetxt(
+        path,
+        table,
+        delimiter=",",
+        header="client_id,frame,delay_ms,fps,skipped",
+        comments="",
+        fmt=["%d", "%d", "%.3f", "%.3f", "%d"],
+    )
+
+
+def encode_frame(frame: np.ndarray) -> bytes:
+    if USE_RAW_FRAMES:
+        return RAW_HEADER.pack(RAW_MAGIC, *frame.shape) + frame.tobytes()
+    return simplejpeg.encode_jpeg(frame, quality=JPEG_ENCODE_QUALITY, colorspace="BGR")
+
+
+def pack_batch(payloads: list[bytes]) -> bytes:
+    parts = [BATCH_HEADER.pack(BATCH_MAGIC, len(payloads))]
+    for payload in payloads:
+        parts.append(FRAME_LEN.pack(len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def cuda_decode_available() -> bool:
+    return hasattr(cv2, "cudacodec") and cv2.cuda.getCudaEnabledDeviceCount() > 0
+
+
+class VideoSource:
+    """
+    영상에서 프레임을 읽어 YOLO 입력 크기로 리사이즈해 반환한다.
+    CUDA 빌드 OpenCV(cudacodec)면 NVDEC 디코딩 + GPU 리사이즈 후 download하고,
+    아니면 VideoCapture(FFmpeg)에 하드웨어 디코딩을 요청한다 (불가 시 소프트웨어).
+    이 경우 OpenCL을 쓸 수 있으면 리사이즈는 UMat(T-API)으로 GPU에서 수행한다.
+    """
+
+    def __init__(self, path: str):
+        self.cap = cv2.VideoCapture(
+            path,
+            cv2.CAP_ANY,
+            [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY],
+        )
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.total = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.reader = None
+
+        if self.cap.isOpened() and cuda_decode_available():
+            try:
+                self.reader = cv2.cudacodec.createVideoReader(path)
+                self.reader.set(cv2.cudacodec.ColorFormat_BGR)
+                self.cap.release()
+            except cv2.error:
+                self.reader = None
+
+        self.use_opencl = self.reader is None and cv2.ocl.haveOpenCL()
+        if self.use_opencl:
+            cv2.ocl.setUseOpenCL(True)
+
+    def is_opened(self) -> bool:
+        return self.reader is not None or self.cap.isOpened()
+
+    def read(self) -> np.ndarray | None:
+        size = (YOLO_INPUT_SIZE, YOLO_INPUT_SIZE)
+        if self.reader is not None:
+            ret, g_frame = self.reader.nextFrame()
+            if not ret:
+                return None
+            return cv2.cuda.resize(g_frame, size).download()
+
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        if self.use_opencl:
+            return cv2.resize(cv2.UMat(frame), size).get()
+        return cv2.resize(frame, size)
+
+    def grab(self) -> bool:
+        """디코딩 결과를 꺼내지 않고 한 프레임 전진 (read보다 저렴)"""
+        if self.reader is not None:
+            return self.reader.grab()
+        return self.cap.grab()
+
+    def release(self) -> None:
+        self.reader = None
+        self.cap.release()
+
+
+@cache
+def pick_video_encoder() -> str:
+    """실제로 열리는 첫 번째 인코더를 선택 (NVENC는 GPU가 없으면 open에서 실패)"""
+    for name in VIDEO_ENCODERS[:-1]:
+        try:
+            ctx = av.CodecContext.create(name, "w")
+            ctx.width = ctx.height = YOLO_INPUT_SIZE
+            ctx.pix_fmt = "yuv420p"
+            ctx.time_base = Fraction(1, 30)
+            ctx.open()
+            return name
+        except Exception:
+            continue
+    return VIDEO_ENCODERS[-1]
+
+
+class VideoSink:
+    """어노테이션된 프레임을 PyAV로 인코딩해 저장"""
+
+    def __init__(self, path: str, fps: float):
+        self.container = av.open(path, mode="w")
+        self.stream = self.container.add_stream(
+            pick_video_encoder(), rate=Fraction(fps).limit_denominator(1001)
+        )
+        self.stream.width = YOLO_INPUT_SIZE
+        self.stream.height = YOLO_INPUT_SIZE
+        self.stream.pix_fmt = "yuv420p"
+
+    def write(self, frame: np.ndarray) -> None:
+        av_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        for packet in self.stream.encode(av_frame):
+            self.container.mux(packet)
+
+    def release(self) -> None:
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+
+def read_and_encode(
+    source: VideoSource, skip: int = 0
+) -> tuple[np.ndarray, bytes, int] | None:
+    """skip개 프레임을 grab으로 건너뛴 뒤 한 프레임을 읽어 인코딩"""
+    skipped = 0
+    while skipped < skip and source.grab():
+        skipped += 1
+    frame_yolo = source.read()
+    if frame_yolo is None:
+        return None
+    return frame_yolo, encode_frame(frame_yolo), skipped
+
+
+def write_annotated(
+    writer: VideoSink, frame_yolo: np.ndarray, detections: list
+) -> None:
+    writer.write(draw_detections(frame_yolo, detections))
+
+
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_SCALE = 0.55
+BOX_COLOR = np.array((0, 255, 0), dtype=np.float32)
+
+# 라벨 문자열 → (알파 마스크 HxWx1, 베이스라인 위 높이)
+# 점수는 소수 둘째 자리까지라 캐시 크기는 클래스 수 × 101개로 제한된다
+_label_cache: dict[str, tuple[np.ndarray, int]] = {}
+
+
+def _label_glyph(text: str) -> tuple[np.ndarray, int]:
+    glyph = _label_cache.get(text)
+    if glyph is None:
+        (w, h), baseline = cv2.getTextSize(text, LABEL_FONT, LABEL_SCALE, 1)
+        canvas = np.zeros((h + baseline, w), dtype=np.uint8)
+        cv2.putText(canvas, text, (0, h), LABEL_FONT, LABEL_SCALE, 255, 1, cv2.LINE_AA)
+        glyph = ((canvas.astype(np.float32) / 255.0)[..., np.newaxis], h)
+        _label_cache[text] = glyph
+    return glyph
 
 
 def draw_detections(frame: np.ndarray, detections: list) -> np.ndarray:
-    for det in detections:
-        x1, y1, x2, y2 = det["box"]
+    """
+    박스는 두께 2px 테두리를 슬라이스 대입으로, 라벨은 캐시한 글리프를
+    알파 합성으로 그린다 (검출마다 cv2 호출 없음).
+    """
+    if not detections:
+        return frame
+
+    h, w = frame.shape[:2]
+    boxes = np.array([d["box"] for d in detections], dtype=np.int32)
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, w - 1)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, h - 1)
+
+    for det, (x1, y1, x2, y2) in zip(detections, boxes.tolist()):
+        frame[y1 : y1 + 2, x1 : x2 + 1] = BOX_COLOR
+        frame[max(y2 - 1, 0) : y2 + 1, x1 : x2 + 1] = BOX_COLOR
+        frame[y1 : y2 + 1, x1 : x1 + 2] = BOX_COLOR
+        frame[y1 : y2 + 1, max(x2 - 1, 0) : x2 + 1] = BOX_COLOR
+
         name = det.get("name", f"cls{det['label']}")
-        score = det["score"]
-        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        cv2.putText(
-            frame,
-            f"{name}: {score:.2f}",
-            (x1, max(y1 - 6, 12)),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.55,
-            (0, 255, 0),
-            1,
-            cv2.LINE_AA,
-        )
+        alpha, text_h = _label_glyph(f"{name}: {det['score']:.2f}")
+        # 글리프를 프레임 경계에 맞게 잘라 (top, x1) 위치에 합성
+        top = max(y1 - 6, 12) - text_h
+        gy = max(-top, 0)
+        gh = min(alpha.shape[0] - gy, h - top - gy)
+        gw = min(alpha.shape[1], w - x1)
+        if gh <= 0 or gw <= 0:
+            continue
+        a = alpha[gy : gy + gh, :gw]
+        roi = frame[top + gy : top + gy + gh, x1 : x1 + gw]
+        roi[:] = roi * (1.0 - a) + BOX_COLOR * a + 0.5
     return frame
 
 
-def print_benchmark_summary(records: list[dict]) -> None:
-    if not records:
+def print_benchmark_summary(delays: np.ndarray, fps: np.ndarray) -> None:
+    if len(delays) == 0:
         return
-    delays = [r["delay_ms"] for r in records]
-    fps_list = [r["fps"] for r in records]
-    print(f"  총 처리 프레임 : {len(records)}")
+    print(f"  총 처리 프레임 : {len(delays)}")
     print(
-        f"  delay (ms)     : min={min(delays):.1f}  max={max(delays):.1f}  avg={sum(delays) / len(delays):.1f}"
+        f"  delay (ms)     : min={delays.min():.1f}  max={delays.max():.1f}  avg={delays.mean():.1f}"
     )
     print(
-        f"  fps            : min={min(fps_list):.2f}  max={max(fps_list):.2f}  avg={sum(fps_list) / len(fps_list):.2f}"
+        f"  fps            : min={fps.min():.2f}  max={fps.max():.2f}  avg={fps.mean():.2f}"
     )
 
 
-async def stream_video(client_id: int) -> list[dict]:
-    cap = cv2.VideoCapture(VIDEO_IN)
-    if not cap.isOpened():
-        return []
+async def stream_video(client_id: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """클라이언트 하나의 스트리밍 실행 → 프레임별 (delay_ms, fps, 직전 스킵 수) 배열"""
+    source = VideoSource(VIDEO_IN)
+    if not source.is_opened():
+        return (
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.int32),
+        )
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = source.fps
+    total = source.total
     writer = None
 
     # 다중 클라이언트의 경우 파일명에 client_id 추가
@@ -99,13 +348,15 @@ async def stream_video(client_id: int) -> list[dict]:
             if args.clients > 1
             else str(out_path)
         )
+        writer = VideoSink(client_video_out, fps)
 
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        writer = cv2.VideoWriter(
-            client_video_out, fourcc, fps, (YOLO_INPUT_SIZE, YOLO_INPUT_SIZE)
-        )
-
-    bench = []
+    # 프레임별 측정값은 미리 할당한 배열에 기록 (프레임 수가 부정확하면 2배씩 확장)
+    delays = np.empty(max(total, 1), dtype=np.float32)
+    fps_arr = np.empty(max(total, 1), dtype=np.float32)
+    skipped_arr = np.empty(max(total, 1), dtype=np.int32)
+    count = 0
+    # 응답 지연 EWMA (ms) — --adaptive-skip일 때 건너뛸 프레임 수 계산에 사용
+    ewma_ms = 0.0
 
     # 각 클라이언트별 프로그레스 바 위치(position) 분리
     pbar = tqdm(
@@ -116,61 +367,120 @@ async def stream_video(client_id: int) -> list[dict]:
         ascii=True,
     )
 
+    # 3단계 파이프라인: 읽기·리사이즈·인코딩 → 송수신 → 그리기·저장
+    # 프레임 N이 서버에서 처리되는 동안 N+1의 CPU 작업을 미리 수행한다.
+    loop = asyncio.get_running_loop()
+    read_pool = ThreadPoolExecutor(max_workers=1)
+    write_pool = ThreadPoolExecutor(max_workers=1)
+    encoded_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    result_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+
+    async def produce():
+        while True:
+            # 지연이 프레임 간격의 k배면 k-1 프레임을 건너뛰어 큐가 쌓이지 않게 함
+            skip = max(0, int(ewma_ms * fps / 1000) - 1) if args.adaptive_skip else 0
+            item = await loop.run_in_executor(read_pool, read_and_encode, source, skip)
+            if item is None:
+                break
+            await encoded_q.put(item)
+        await encoded_q.put(None)
+
+    async def exchange(ws):
+        nonlocal delays, fps_arr, skipped_arr, count, ewma_ms
+        done = False
+        while not done:
+            batch = []
+            while len(batch) < args.batch_size:
+                item = await encoded_q.get()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            if not batch:
+                break
+
+            if args.batch_size > 1:
+                payload = pack_batch([p for _, p, _ in batch])
+            else:
+                payload = batch[0][1]
+
+            t0 = time.perf_counter()
+            await ws.send(payload)
+            msg = await ws.recv()
+            t1 = time.perf_counter()
+
+            # 배치 왕복 시간을 프레임 수로 균등 분배
+            delay_ms = (t1 - t0) * 1000 / len(batch)
+            inst_fps = 1000.0 / delay_ms if delay_ms > 0 else 0.0
+            ewma_ms = (
+                delay_ms
+                if count == 0
+                else SKIP_EWMA_ALPHA * delay_ms + (1 - SKIP_EWMA_ALPHA) * ewma_ms
+            )
+
+            if writer:
+                reply = orjson.loads(msg)
+                if args.batch_size > 1:
+                    batched = reply.get("batched") or [[]] * len(batch)
+                else:
+                    batched = [reply.get("detections", [])]
+                for (frame_yolo, _, _), detections in zip(batch, batched):
+                    await result_q.put((frame_yolo, detections))
+
+            if count + len(batch) > len(delays):
+                delays = np.resize(delays, 2 * (count + len(batch)))
+                fps_arr = np.resize(fps_arr, len(delays))
+                skipped_arr = np.resize(skipped_arr, len(delays))
+            delays[count : count + len(batch)] = delay_ms
+            fps_arr[count : count + len(batch)] = inst_fps
+            skipped_arr[count : count + len(batch)] = [
+                skipped for _, _, skipped in batch
+            ]
+            count += len(batch)
+
+            pbar.update(len(batch) + sum(skipped for _, _, skipped in batch))
+            pbar.set_postfix(delay=f"{delay_ms:.1f}ms", fps=f"{inst_fps:.1f}")
+        await result_q.put(None)
+
+    async def consume():
+        while (item := await result_q.get()) is not None:
+            await loop.run_in_executor(write_pool, write_annotated, writer, *item)
+
     try:
+        # JPEG/RAW 프레임은 deflate 이득이 없으므로 permessage-deflate 비활성화
         async with websockets.connect(
-            WS_URL, max_size=MAX_WS_MSG_BYTES, open_timeout=MAX_WS_TIMEOUT
+            WS_URL,
+            max_size=MAX_WS_MSG_BYTES,
+            open_timeout=MAX_WS_TIMEOUT,
+            compression=None,
+            write_limit=MAX_WS_WRITE_BUFFER,
         ) as ws:
-            idx = 0
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                frame_yolo = cv2.resize(frame, (YOLO_INPUT_SIZE, YOLO_INPUT_SIZE))
-                _, buf = cv2.imencode(
-                    ".jpg", frame_yolo, [cv2.IMWRITE_JPEG_QUALITY, JPEG_ENCODE_QUALITY]
-                )
-
-                t0 = time.perf_counter()
-                await ws.send(buf.tobytes())
-                msg = await ws.recv()
-                t1 = time.perf_counter()
-
-                delay_ms = (t1 - t0) * 1000
-                inst_fps = 1000.0 / delay_ms if delay_ms > 0 else 0.0
-
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(produce())
+                tg.create_task(exchange(ws))
                 if writer:
-                    detections = json.loads(msg).get("detections", [])
-                    annotated = draw_detections(frame_yolo.copy(), detections)
-                    writer.write(annotated)
-
-                bench.append(
-                    {
-                        "client_id": client_id,
-                        "frame": idx + 1,
-                        "delay_ms": round(delay_ms, 3),
-                        "fps": round(inst_fps, 3),
-                    }
-                )
-
-                idx += 1
-                pbar.update(1)
-                pbar.set_postfix(delay=f"{delay_ms:.1f}ms", fps=f"{inst_fps:.1f}")
-
+                    tg.create_task(consume())
     except Exception as e:
+        if isinstance(e, ExceptionGroup):
+            e = e.exceptions[0]
         pbar.write(f"[Client {client_id} 오류] {e}")
     finally:
         pbar.close()
-        cap.release()
+        read_pool.shutdown()
+        write_pool.shutdown()
+        source.release()
         if writer:
             writer.release()
 
-    return bench
+    return delays[:count], fps_arr[:count], skipped_arr[:count]
 
 
 async def main():
     print(f"입력 : {VIDEO_IN}")
     print(f"서버 : {WS_URL}")
+    print(f"전송 : {'RAW' if USE_RAW_FRAMES else 'JPEG'}")
+    if args.video_out:
+        print(f"인코더 : {pick_video_encoder()}")
     print(f"클라이언트 수 : {args.clients}개 동시 접속\n")
 
     tasks = [stream_video(i) for i in range(args.clients)]
@@ -179,14 +489,16 @@ async def main():
     # 콘솔 출력 겹침 방지용 줄바꿈
     print("\n" * args.clients)
 
-    all_benchmarks = []
-    for bench in results:
-        all_benchmarks.extend(bench)
-
-    if all_benchmarks:
-        save_benchmark(all_benchmarks, BENCH_OUT)
+    if any(len(delays) for delays, _, _ in results):
+        save_benchmark(results, BENCH_OUT)
         print(f"── 벤치마크 요약 ({args.clients} Clients) ────────────────")
-        print_benchmark_summary(all_benchmarks)
+        print_benchmark_summary(
+            np.concatenate([delays for delays, _, _ in results]),
+            np.concatenate([fps for _, fps, _ in results]),
+        )
+        if args.adaptive_skip:
+            skipped = sum(int(skipped.sum()) for _, _, skipped in results)
+            print(f"  건너뛴 프레임  : {skipped}")
         print(f"────────────────────────────────────────────────")
         print(f"\n완료!")
         if args.video_out:
@@ -195,4 +507,7 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())